@@ -1,10 +1,23 @@
 import gradio as gr
+from config import settings
 from ui import chat
 from ui import summary
 from models import llm_model_dict, llm_model_dict_list, \
     embedding_model_dict_list
 from models import models
 
+# 启动时在后台线程预热模型, UI 先行启动
+warmup = settings.get("startup.warmup", False)
+default_llm_model = list(llm_model_dict.keys())[0]
+default_llm_lora = ""
+default_embedding_model = embedding_model_dict_list[0]
+if warmup:
+    # 页面上的模型选项与预热的模型保持一致, 索引文件按 embedding 模型名命名
+    default_llm_model = settings.get("startup.llm_model", default_llm_model)
+    default_llm_lora = settings.get("startup.llm_lora", default_llm_lora)
+    default_embedding_model = settings.get("startup.embedding_model", default_embedding_model)
+    models.init_model_background(default_llm_model, default_llm_lora, default_embedding_model)
+
 block_css = """.importantButton {
     background: linear-gradient(45deg, #7e0570,#5d1c99, #6e00ff) !important;
     border: none !important;
@@ -24,15 +37,15 @@ with gr.Blocks(css=block_css) as demo:
     with gr.Tab("load model"):
         llm_model = gr.Radio(llm_model_dict_list,
                              label="LLM 模型",
-                             value=list(llm_model_dict.keys())[0],
+                             value=default_llm_model,
                              interactive=True)
-        llm_lora = gr.Textbox(label="lora path", value="")
+        llm_lora = gr.Textbox(label="lora path", value=default_llm_lora)
         embedding_model = gr.Radio(embedding_model_dict_list,
                                    label="Embedding 模型",
-                                   value=embedding_model_dict_list[0],
+                                   value=default_embedding_model,
                                    interactive=True)
 
-        result = gr.Label("模型未加载")
+        result = gr.Label(models.status)
 
         load_model_button = gr.Button(
             "重新加载模型" if models.is_active() else "加载模型"
@@ -50,6 +63,10 @@ with gr.Blocks(css=block_css) as demo:
     with gr.Tab("Summary"):
         summary.summary_ui()
 
+    # 预热或使用推理服务时轮询模型状态
+    if warmup or settings.get("server.url", ""):
+        demo.load(lambda: models.status, inputs=None, outputs=result, every=5)
+
 demo.queue(concurrency_count=3).launch(
     server_name='0.0.0.0', share=False, inbrowser=False
 )
@@ -8,6 +8,3 @@ settings = Dynaconf(
 
 # `envvar_prefix` = export envvars with `export DYNACONF_FOO=bar`.
 # `settings_files` = Load these files in the order.
-
-llm_model_dict_list = list(llm_model_dict.keys())
-embedding_model_dict_list = list(embedding_model_dict.keys())
\ No newline at end of file
@@ -1,9 +1,9 @@
 import os
+import threading
 
 from loguru import logger
 
-from utils.chatpdf import ChatPDF
-from utils.llm import LLM
+from config import settings
 from utils.singleton import Singleton
 
 MAX_INPUT_LEN = 2048
@@ -31,16 +31,37 @@ llm_model_dict_list = list(llm_model_dict.keys())
 embedding_model_dict_list = list(embedding_model_dict.keys())
 
 
+def get_embedding_model_type(embedding_model_path):
+    """embedding 后端类型, 在 settings.toml 的 [models.embeddings] 中按模型配置: default / onnx"""
+    for embedding in settings.get("models.embeddings", {}).values():
+        if embedding.get("path") == embedding_model_path:
+            return embedding.get("type", "default")
+    return "default"
+
+
 @Singleton
 class Models(object):
 
     def __init__(self):
         self._chatpdf = None
         self._llm_model = None
+        # 已加载的模型名, 只重新加载有变化的部分
+        self._llm_model_name = None
+        self._embedding_model_name = None
+        self._status = "模型未加载"
+        self._lock = threading.Lock()
+        self._loading_thread = None
 
     def is_active(self):
         return self._chatpdf is not None and self._llm_model is not None
 
+    def is_loading(self):
+        return self._loading_thread is not None and self._loading_thread.is_alive()
+
+    @property
+    def status(self):
+        return self._status
+
     @property
     def chatpdf(self):
         return self._chatpdf
@@ -58,35 +79,94 @@ class Models(object):
 
         self._chatpdf = None
         self._llm_model = None
+        self._llm_model_name = None
+        self._embedding_model_name = None
+
+    def init_model_background(self, llm_model, llm_lora, embedding_model):
+        """后台线程预热模型, 不阻塞 UI 启动, 通过 status/is_active 查看加载状态"""
+        if self.is_loading():
+            return self._status
+        self._loading_thread = threading.Thread(
+            target=self.init_model,
+            args=(llm_model, llm_lora, embedding_model),
+            name="models-warmup",
+            daemon=True
+        )
+        self._loading_thread.start()
+        return self._status
 
     def init_model(self, llm_model, llm_lora, embedding_model):
+        with self._lock:
+            return self._init_model(llm_model, llm_lora, embedding_model)
+
+    def _init_model(self, llm_model, llm_lora, embedding_model):
+        # torch/transformers/textgen 等在首次加载模型时才导入
+        from utils.answer_cache import SemanticAnswerCache
+        from utils.chatpdf import ChatPDF
+        from utils.llm import LLM
+
         try:
-            self.reset_model()
+            self._status = f"模型{llm_model} lora:{llm_lora} embedding:{embedding_model}加载中"
 
             llm_lora_path = None
             if llm_lora is not None and os.path.exists(llm_lora):
                 llm_lora_path = llm_lora
-            self._chatpdf = ChatPDF(
-                sim_model_name_or_path=embedding_model_dict.get(
+
+            if self._chatpdf is None or embedding_model != self._embedding_model_name:
+                if self._chatpdf is not None:
+                    del self._chatpdf
+                    self._chatpdf = None
+                embedding_model_path = embedding_model_dict.get(
                     embedding_model,
                     "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-                ),
-
-            )
-            self._llm_model = LLM(
-                gen_model_type=llm_model.split('-')[0],
-                gen_model_name_or_path=llm_model_dict.get(llm_model, "THUDM/chatglm-6b-int4"),
-                lora_model_name_or_path=llm_lora_path
-            )
+                )
+                self._chatpdf = ChatPDF(
+                    sim_model_name_or_path=embedding_model_path,
+                    sim_model_type=get_embedding_model_type(embedding_model_path),
+                    onnx_num_threads=settings.get("onnx.num_threads", 0),
+                    answer_cache=SemanticAnswerCache(
+                        threshold=settings.get("cache.threshold", 0.95),
+                        ttl=settings.get("cache.ttl", 3600),
+                        max_entries=settings.get("cache.max_entries", 1024),
+                    ),
+                    summary_threshold=settings.get("summary_index.threshold", 0.75),
+                )
+                self._embedding_model_name = embedding_model
+
+            if self._llm_model is None or llm_model != self._llm_model_name:
+                if self._llm_model is not None:
+                    del self._llm_model
+                    self._llm_model = None
+                self._llm_model = LLM(
+                    gen_model_type=llm_model.split('-')[0],
+                    gen_model_name_or_path=llm_model_dict.get(llm_model, "THUDM/chatglm-6b-int4"),
+                    lora_model_name_or_path=llm_lora_path,
+                    max_loaded_loras=settings.get("lora.max_loaded", 4),
+                )
+                self._llm_model_name = llm_model
+                # 缓存的答案由之前的基础模型生成
+                if self._chatpdf is not None and self._chatpdf.answer_cache is not None:
+                    self._chatpdf.answer_cache.clear()
+            else:
+                # 基础模型不变, 只切换 lora
+                self._llm_model.set_default_lora(llm_lora_path)
             if self._chatpdf is not None and self._llm_model is not None:
                 model_status = f"模型{llm_model} lora:{llm_lora} embedding:{embedding_model}已成功加载"
             else:
                 model_status = f"llm:{self._llm_model} pdf:{self._chatpdf}加载失败"
             logger.info(model_status)
+            self._status = model_status
             return model_status
         except Exception as e:
             logger.error(f"加载模型失败:{e}")
+            self._status = f"加载模型失败:{e}"
             raise e
 
 
-models = Models.instance()
+if settings.get("server.url", ""):
+    # 模型由本地推理服务进程持有, 多个 UI 进程共享
+    from utils.inference_server import RemoteModels
+
+    models = RemoteModels(settings.get("server.url"))
+else:
+    models = Models.instance()
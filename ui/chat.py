@@ -1,11 +1,9 @@
 import gradio as gr
 import os
-import shutil
 from loguru import logger
-from utils.chatpdf import ChatPDF
-import hashlib
-from utils.llm import LLM
+from config import settings
 from models import MAX_INPUT_LEN, models
+from utils.content_store import ContentStore
 
 pwd_path = os.path.abspath(os.path.dirname(__file__))
 
@@ -13,20 +11,18 @@ CONTENT_DIR = os.path.join(pwd_path, "content")
 logger.info(f"CONTENT_DIR: {CONTENT_DIR}")
 VECTOR_SEARCH_TOP_K = 3
 
+content_store = ContentStore(CONTENT_DIR, hash_algorithm=settings.get("content.hash_algorithm", "md5"))
+
 
 def get_file_list():
-    if not os.path.exists("content"):
-        return []
-    return [f for f in os.listdir("content") if
-            f.endswith(".txt") or f.endswith(".pdf") or f.endswith(".docx") or f.endswith(".md")]
+    return content_store.get_file_list()
 
 
 def upload_file(file, file_list):
-    if not os.path.exists(CONTENT_DIR):
-        os.mkdir(CONTENT_DIR)
-    filename = os.path.basename(file.name)
-    shutil.move(file.name, os.path.join(CONTENT_DIR, filename))
+    filename = content_store.add_file(file.name)
     # file_list首位插入新上传的文件
+    if filename in file_list:
+        file_list.remove(filename)
     file_list.insert(0, filename)
     return gr.Dropdown.update(choices=file_list, value=filename), file_list
 
@@ -70,18 +66,21 @@ def get_answer(
         history,
         topn: int = VECTOR_SEARCH_TOP_K,
         max_input_size: int = 1024,
-        chat_mode: str = "pdf"
+        chat_mode: str = "pdf",
+        use_cache: bool = True,
+        llm_lora: str = ""
 ):
     if not models.is_active():
         return [None, "模型还未加载"], query
     if index_path and chat_mode == "pdf":
-        if not models.chatpdf.sim_model.corpus_embeddings:
-            models.chatpdf.load_index(index_path)
         response, empty_history, reference_results = models.chatpdf.query(
             llm_model=models.llm_model,
             query=query,
             topn=topn,
-            max_input_size=max_input_size
+            max_input_size=max_input_size,
+            use_cache=use_cache,
+            lora_model_name_or_path=llm_lora,
+            index_path=index_path
         )
 
         logger.debug(f"query: {query}, response with content: {response}")
@@ -92,7 +91,7 @@ def get_answer(
         history = history + [[query, response]]
     else:
         # 未加载文件，仅返回生成模型结果
-        response, empty_history = models.llm_model.chat(query, history)
+        response, empty_history = models.llm_model.chat(query, history, lora_model_name_or_path=llm_lora)
         response = parse_text(response)
         history = history + [[query, response]]
         logger.debug(f"query: {query}, response: {response}")
@@ -105,30 +104,31 @@ def update_status(history, status):
     return history
 
 
-def get_file_hash(fpath):
-    return hashlib.md5(open(fpath, 'rb').read()).hexdigest()
-
-
-def get_vector_store(filepath, history, embedding_model):
+def get_vector_store(filepath, history, embedding_model, build_summary_index=False, llm_lora=""):
     logger.info(filepath, history)
     index_path = None
     file_status = ''
-    if models.chatpdf is not None:
+    if models.is_active():
 
         local_file_path = os.path.join(CONTENT_DIR, filepath)
 
-        local_file_hash = get_file_hash(local_file_path)
+        local_file_hash = content_store.get_file_hash(filepath)
         index_file_name = f"{filepath}.{embedding_model}.{local_file_hash}.index.json"
 
         local_index_path = os.path.join(CONTENT_DIR, index_file_name)
 
         if os.path.exists(local_index_path):
             models.chatpdf.load_index(local_index_path)
+            if build_summary_index and not models.chatpdf.has_summary_index():
+                models.chatpdf.build_summary_index(models.llm_model, lora_model_name_or_path=llm_lora)
+                models.chatpdf.save_index(local_index_path)
             index_path = local_index_path
             file_status = "文件已成功加载，请开始提问"
 
         elif os.path.exists(local_file_path):
             models.chatpdf.load_pdf_file(local_file_path)
+            if build_summary_index:
+                models.chatpdf.build_summary_index(models.llm_model, lora_model_name_or_path=llm_lora)
             models.chatpdf.save_index(local_index_path)
             index_path = local_index_path
             if index_path:
@@ -166,6 +166,9 @@ def chat_ui(embedding_model):
         with gr.Column(scale=1):
             with gr.Row():
                 chat_mode = gr.Radio(choices=["chat", "pdf"], value="pdf", label="聊天模式")
+                use_cache = gr.Checkbox(value=True, label="使用答案缓存")
+            with gr.Row():
+                llm_lora = gr.Textbox(label="lora path(为空使用加载模型时的lora)", value="")
 
             with gr.Row():
                 topn = gr.Slider(1, 100, 20, step=1, label="最大搜索数量")
@@ -185,6 +188,7 @@ def chat_ui(embedding_model):
                     label="content file",
                     file_types=['.txt', '.md', '.docx', '.pdf']
                 )
+            build_summary_index = gr.Checkbox(value=False, label="生成摘要索引(加载文件时逐段生成摘要, 用于概括性问题)")
             load_file_button = gr.Button("加载文件")
 
     # 将上传的文件保存到content文件夹下,并更新下拉框
@@ -196,12 +200,12 @@ def chat_ui(embedding_model):
     load_file_button.click(
         get_vector_store,
         show_progress=True,
-        inputs=[selectFile, chatbot, embedding_model],
+        inputs=[selectFile, chatbot, embedding_model, build_summary_index, llm_lora],
         outputs=[index_path, chatbot],
     )
     query.submit(
         get_answer,
-        [query, index_path, chatbot, topn, max_input_size, chat_mode],
+        [query, index_path, chatbot, topn, max_input_size, chat_mode, use_cache, llm_lora],
         [chatbot, query],
     )
     clear_btn.click(reset_chat, [chatbot, query], [chatbot, query])
@@ -1,9 +1,11 @@
+import os
 import re
 
 import gradio as gr
 from typing import List, Tuple
 from models import models
 from loguru import logger
+from utils.chunk_store import ChunkStore
 import re
 
 PROMPT_TEMPLATE = """\
@@ -11,6 +13,10 @@ PROMPT_TEMPLATE = """\
 {context_str}
 """
 
+PREVIEW_PAGE_SIZE = 10
+
+chunk_store = ChunkStore()
+
 
 def get_text_lines(input_txt: str) -> List[str]:
     lines = input_txt.splitlines()
@@ -66,37 +72,97 @@ def get_pre_post_lines(idx: int, lines: List[str], line_coincide_length: int = 0
     return pre_lines, post_lines
 
 
-def get_text_limit_length(input_txt: str, max_length: int = 2048, line_coincide_length: int = 0) -> List[str]:
+def get_text_chunks(input_txt: str, max_length: int = 2048, line_coincide_length: int = 0) -> List[dict]:
+    """
+    Split text into chunks, input_txt[offset:offset + length] is the chunk content,
+    `pre`/`post` are the coincide text of the neighbouring chunks.
+    """
     lines = get_text_lines(input_txt)
-    output: List[str] = []
+    output: List[dict] = []
+    pos = 0
     for idx, line in enumerate(lines):
+        offset = input_txt.find(line, pos)
+        pos = offset + len(line)
 
         if len(line) <= max_length:
             pre_lines, post_lines = get_pre_post_lines(idx, lines, line_coincide_length)
-            output.extend(f"{pre_lines[-1]}{line}{post_lines[0]}")
+            output.append({"offset": offset, "length": len(line), "pre": pre_lines[-1], "post": post_lines[0]})
         else:
             text_lines = split_in_line(line, max_length)
             logger.debug(f"split in line: {len(text_lines)}")
             # logger.debug(f"{line} ==> {text_lines}")
             for j, text_line in enumerate(text_lines):
                 pre_lines, post_lines = get_pre_post_lines(j, text_lines, line_coincide_length)
-                output.append(f"{pre_lines[-1]}{text_line}{post_lines[0]}")
+                output.append({
+                    "offset": offset,
+                    "length": len(text_line),
+                    "pre": pre_lines[-1],
+                    "post": post_lines[0],
+                })
+                offset += len(text_line)
     return output
 
 
-def split_input_text(input_txt, strip_input_lines=0, max_length=2048, line_coincide_length=0):
+def get_session_id(session_id):
+    return session_id or chunk_store.new_session_id()
+
+
+def get_chunk_preview(session_id, page=1):
+    if not session_id:
+        return "", 1, ""
+    chunks, page, total_pages = chunk_store.get_page(session_id, page, PREVIEW_PAGE_SIZE)
+    start = (page - 1) * PREVIEW_PAGE_SIZE
+    texts = chunk_store.get_chunk_texts(session_id, chunks)
+    preview = "\n\n".join(
+        f"[{start + idx + 1}] offset:{chunk['offset']} len:{len(text)}\n{text}"
+        for idx, (chunk, text) in enumerate(zip(chunks, texts))
+    )
+    return preview, page, f"共 {len(chunk_store.get_chunks(session_id))} 段, 第 {page}/{total_pages} 页"
+
+
+def load_text_file(file, session_id):
+    """Read an uploaded file into the chunk store, the text never goes through a textbox."""
+    from utils.chatpdf import ChatPDF
+
+    session_id = get_session_id(session_id)
+    file_path = file.name
+    if file_path.endswith('.pdf'):
+        text = "\n".join(ChatPDF.extract_text_from_pdf(file_path))
+    elif file_path.endswith('.docx'):
+        text = "\n".join(ChatPDF.extract_text_from_docx(file_path))
+    else:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    chunk_store.set_source(session_id, text, name=os.path.basename(file_path))
+    logger.debug(f"load text file: {file_path} {len(text)}")
+    return session_id, f"已上传 {os.path.basename(file_path)}: {len(text)} 字, 请点击分段"
+
+
+def split_input_text(session_id, input_txt, strip_input_lines=0, max_length=2048, line_coincide_length=0):
+    """Split the input text (or the uploaded file when it is empty) and keep the chunks in the chunk store."""
+    session_id = get_session_id(session_id)
+    if input_txt:
+        chunk_store.set_source(session_id, input_txt)
+    else:
+        input_txt = chunk_store.get_source(session_id)
     if strip_input_lines > 0:
         pattern = r'[\r\n]{' + str(strip_input_lines) + r',}'
         re.compile(pattern=pattern)
         logger.debug(f"strip input txt: {pattern}")
         input_txt = re.sub(pattern, '', input_txt)
-    lines = get_text_limit_length(input_txt, max_length, line_coincide_length)
-    logger.debug(f"split input txt: {len(lines)}")
-    return "\n\n\n".join(lines)
+    chunks = get_text_chunks(input_txt, max_length, line_coincide_length)
+    logger.debug(f"split input txt: {len(chunks)}")
+    # offsets 指向去除空行后的文本, 与分段结果一起保存
+    chunk_store.set_chunks(session_id, chunks, input_txt)
+    return (session_id, *get_chunk_preview(session_id, 1))
+
 
+def get_chunk_lines(session_id) -> List[str]:
+    return chunk_store.get_chunk_texts(session_id) if session_id else []
 
-def gen_keyword_summary(input_txt, keyword_prompt, summary_prompt, max_length=2048):
-    lines = input_txt.split("\n\n\n")
+
+def gen_keyword_summary(session_id, keyword_prompt, summary_prompt, max_length=2048, llm_lora=""):
+    lines = get_chunk_lines(session_id)
     keywords_output = []
     for line in lines:
         keywords = models.llm_model.generate_answer(
@@ -104,7 +170,8 @@ def gen_keyword_summary(input_txt, keyword_prompt, summary_prompt, max_length=20
             line,
             history=None,
             max_length=max_length,
-            prompt_template=PROMPT_TEMPLATE
+            prompt_template=PROMPT_TEMPLATE,
+            lora_model_name_or_path=llm_lora
         )[0]
         logger.debug(f"text len: {len(line)} ==> {keywords}")
         keywords_output.extend(keywords.split())
@@ -113,8 +180,7 @@ def gen_keyword_summary(input_txt, keyword_prompt, summary_prompt, max_length=20
     return f"保留关键信息:\"{' '.join(keywords_output)},{summary_prompt}\""
 
 
-def gen_recursive_summary(input_txt, summary_prompt, max_length=2048):
-    lines = input_txt.split("\n\n\n")
+def gen_recursive_summary(lines, summary_prompt, max_length=2048, llm_lora=""):
     output_summary = []
     summary = ""
     for idx, line in enumerate(lines):
@@ -124,7 +190,8 @@ def gen_recursive_summary(input_txt, summary_prompt, max_length=2048):
                 line,
                 history=None,
                 max_length=max_length,
-                prompt_template=PROMPT_TEMPLATE
+                prompt_template=PROMPT_TEMPLATE,
+                lora_model_name_or_path=llm_lora
             )[0]
             logger.debug(f"text len: {len(line)} ==> {summary}")
         else:
@@ -133,7 +200,8 @@ def gen_recursive_summary(input_txt, summary_prompt, max_length=2048):
                 f"{summary}\n{line}",
                 history=None,
                 max_length=max_length,
-                prompt_template=PROMPT_TEMPLATE
+                prompt_template=PROMPT_TEMPLATE,
+                lora_model_name_or_path=llm_lora
             )[0]
             logger.debug(f"summary: {len(summary)} + text: {len(line)}  ==> {summary}")
         output_summary.append(summary)
@@ -141,8 +209,7 @@ def gen_recursive_summary(input_txt, summary_prompt, max_length=2048):
     return "\n\n\n".join(output_summary)
 
 
-def gen_subsection_summary(input_txt, summary_prompt, max_length=2048):
-    lines = input_txt.split("\n\n\n")
+def gen_subsection_summary(lines, summary_prompt, max_length=2048, llm_lora=""):
     output_summary = []
 
     for idx, line in enumerate(lines):
@@ -151,7 +218,8 @@ def gen_subsection_summary(input_txt, summary_prompt, max_length=2048):
             f"{line}",
             history=None,
             max_length=max_length,
-            prompt_template=PROMPT_TEMPLATE
+            prompt_template=PROMPT_TEMPLATE,
+            lora_model_name_or_path=llm_lora
         )[0]
         logger.debug(f"text: {len(line)}  ==> {summary}")
         output_summary.append(summary)
@@ -159,11 +227,12 @@ def gen_subsection_summary(input_txt, summary_prompt, max_length=2048):
     return "\n\n\n".join(output_summary)
 
 
-def gen_summary(input_txt, summary_mode, keyword_prompt, summary_prompt, max_length=2048):
+def gen_summary(session_id, summary_mode, keyword_prompt, summary_prompt, max_length=2048, llm_lora=""):
+    lines = get_chunk_lines(session_id)
     if summary_mode == "分段摘要":
-        return gen_subsection_summary(input_txt, summary_prompt, max_length)
+        return gen_subsection_summary(lines, summary_prompt, max_length, llm_lora)
     elif summary_mode == "递归摘要":
-        return gen_recursive_summary(input_txt, summary_prompt, max_length)
+        return gen_recursive_summary(lines, summary_prompt, max_length, llm_lora)
 
 
 def summary_ui():
@@ -179,6 +248,7 @@ def summary_ui():
                 value=2
             )
             summary_mode = gr.Radio(choices=["分段摘要", "递归摘要", ], label="摘要模式", value="递归摘要")
+            llm_lora = gr.Textbox(label="lora path(为空使用加载模型时的lora)", value="")
         with gr.Column(scale=4):
             keyword_prompt = gr.Textbox(
                 lines=1,
@@ -199,9 +269,18 @@ def summary_ui():
         value="生成以下内容的摘要:"
     )
 
+    session_id = gr.State("")
+
     with gr.Row():
-        input_text = gr.Textbox(lines=20, max_lines=60, label="输入文本", placeholder="请输入文本")
-        split_text = gr.Textbox(lines=20, max_lines=60, label="分段文本", placeholder="请输入分段文本")
+        with gr.Column():
+            input_text = gr.Textbox(lines=20, max_lines=60, label="输入文本", placeholder="请输入文本")
+            input_file = gr.File(label="上传文本文件(大文件不经过输入框)", file_types=['.txt', '.md', '.docx', '.pdf'])
+            file_status = gr.Markdown("")
+        with gr.Column():
+            split_text = gr.Textbox(lines=20, max_lines=60, label="分段预览", interactive=False)
+            with gr.Row():
+                split_page = gr.Number(value=1, label="页码", precision=0)
+                split_info = gr.Markdown("")
         summary = gr.Textbox(lines=20, max_lines=60, label="生成摘要", placeholder="请输入生成摘要的Prompt")
 
     with gr.Row():
@@ -209,20 +288,32 @@ def summary_ui():
         btn_keyword = gr.Button("提取关键词")
         btn_summary = gr.Button("生成摘要")
 
+    input_file.upload(
+        lambda file, sid: (*load_text_file(file, sid), ""),
+        inputs=[input_file, session_id],
+        outputs=[session_id, file_status, input_text]
+    )
+
     btn_split.click(
         split_input_text,
-        inputs=[input_text, strip_input_lines, line_max_length, line_coincide_length],
-        outputs=[split_text]
+        inputs=[session_id, input_text, strip_input_lines, line_max_length, line_coincide_length],
+        outputs=[session_id, split_text, split_page, split_info]
+    )
+
+    split_page.submit(
+        get_chunk_preview,
+        inputs=[session_id, split_page],
+        outputs=[split_text, split_page, split_info]
     )
 
     btn_summary.click(
         gen_summary,
-        inputs=[split_text, summary_mode, keyword_summary_prompt, line_max_length],
+        inputs=[session_id, summary_mode, keyword_prompt, keyword_summary_prompt, line_max_length, llm_lora],
         outputs=[summary]
     )
 
     btn_keyword.click(
         gen_keyword_summary,
-        inputs=[split_text, keyword_prompt, summary_prompt, line_max_length],
+        inputs=[session_id, keyword_prompt, summary_prompt, line_max_length, llm_lora],
         outputs=[keyword_summary_prompt]
     )
@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from loguru import logger
+
+
+class SemanticAnswerCache(object):
+    """
+    Answer cache for document questions, scoped per index file.
+    A query hits when its embedding's cosine similarity with a cached query in the same scope
+    reaches `threshold`; entries expire after `ttl` seconds and the least recently used are evicted.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600, max_entries: int = 1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def _expire(self, now):
+        if self.ttl <= 0:
+            return
+        for key in [key for key, entry in self._entries.items() if now - entry["time"] > self.ttl]:
+            del self._entries[key]
+
+    def get(self, scope, embedding):
+        """Returns the cached value of the most similar query in scope, or None."""
+        embedding = self._normalize(embedding)
+        with self._lock:
+            self._expire(time.time())
+            keys = [key for key in self._entries if key[0] == scope]
+            if not keys:
+                return None
+            scores = np.stack([self._entries[key]["embedding"] for key in keys]) @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self._entries.move_to_end(keys[best])
+            logger.debug(f"answer cache hit: {keys[best][1]} score: {scores[best]:.4f}")
+            return self._entries[keys[best]]["value"]
+
+    def put(self, scope, query: str, embedding, value):
+        with self._lock:
+            self._entries[(scope, query)] = {
+                "embedding": self._normalize(embedding),
+                "value": value,
+                "time": time.time(),
+            }
+            self._entries.move_to_end((scope, query))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, scope=None):
+        with self._lock:
+            if scope is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == scope]:
+                del self._entries[key]
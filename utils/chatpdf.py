@@ -1,10 +1,4 @@
-from similarities import Similarity
-from textgen import ChatGlmModel, LlamaModel
-from transformers import pipeline
 from loguru import logger
-import torch
-
-device_id = 0 if torch.cuda.is_available() else -1
 
 PROMPT_TEMPLATE = """\
 基于以下已知信息，简洁和专业的来回答用户的问题。
@@ -22,12 +16,52 @@ class ChatPDF:
     def __init__(
             self,
             sim_model_name_or_path: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+            sim_model_type: str = "default",
+            onnx_num_threads: int = 0,
+            answer_cache=None,
+            summary_threshold: float = 0.75,
 
     ):
-        self.sim_model = Similarity(model_name_or_path=sim_model_name_or_path)
+        from similarities import Similarity
+
+        if sim_model_type == "onnx":
+            from utils.onnx_embedding import OnnxSentenceModel
+            sentence_model = OnnxSentenceModel(sim_model_name_or_path, num_threads=onnx_num_threads)
+            self.sim_model = Similarity(model_name_or_path=sentence_model)
+        elif sim_model_type == "default":
+            self.sim_model = Similarity(model_name_or_path=sim_model_name_or_path)
+        else:
+            raise ValueError('sim_model_type must be default or onnx.')
 
         self.history = None
         self.pdf_path = None
+        self.index_path = None
+        # utils.answer_cache.SemanticAnswerCache, 按索引文件缓存答案
+        self.answer_cache = answer_cache
+        # utils.summary_index.SummaryIndex, 与索引文件一起保存的文档摘要树
+        self.summary_index = None
+        self.summary_threshold = summary_threshold
+
+    def has_index(self):
+        return bool(self.sim_model.corpus_embeddings)
+
+    def has_summary_index(self):
+        return self.summary_index is not None and len(self.summary_index) > 0
+
+    def build_summary_index(self, llm_model, chunk_length: int = 1024, section_fanout: int = 8,
+                            lora_model_name_or_path: str = None):
+        """Build the chunk/section/document summary tree of the loaded corpus."""
+        from utils.summary_index import SummaryIndex
+
+        summary_index = SummaryIndex(self.sim_model.sentence_model, threshold=self.summary_threshold)
+        summary_index.build(
+            list(self.sim_model.corpus.values()),
+            llm_model,
+            chunk_length=chunk_length,
+            section_fanout=section_fanout,
+            lora_model_name_or_path=lora_model_name_or_path,
+        )
+        self.summary_index = summary_index
 
     def load_pdf_file(self, pdf_path: str):
         """Load a PDF file."""
@@ -39,8 +73,13 @@ class ChatPDF:
             corpus = self.extract_text_from_markdown(pdf_path)
         else:
             corpus = self.extract_text_from_txt(pdf_path)
+        # add_corpus 会合并已有语料, 每次只保留当前文件
+        self.sim_model.corpus = {}
+        self.sim_model.corpus_embeddings = []
         self.sim_model.add_corpus(corpus)
         self.pdf_path = pdf_path
+        # 摘要索引只属于生成它时的语料
+        self.summary_index = None
 
     @staticmethod
     def extract_text_from_pdf(file_path: str):
@@ -104,16 +143,43 @@ class ChatPDF:
             max_length: int = 1024,
             max_input_size: int = 1024,
             use_history: bool = False,
+            use_cache: bool = True,
+            lora_model_name_or_path: str = None,
+            use_summary_index: bool = True,
+            index_path: str = None,
 
     ):
-        """Query from corpus."""
-
-        sim_contents = self.sim_model.most_similar(query, topn=topn)
+        """Query from corpus, `index_path` is loaded first when another index is loaded."""
+        if index_path and index_path != self.index_path:
+            self.load_index(index_path)
+        use_cache = use_cache and not use_history and self.answer_cache is not None and self.index_path is not None
+        # 不同 lora 和检索参数的答案分开缓存, 之后生成摘要树的索引也不再复用之前的答案
+        cache_scope = (
+            self.index_path, llm_model.resolve_lora(lora_model_name_or_path), topn, max_input_size,
+            use_summary_index and self.has_summary_index()
+        )
+        query_embedding = None
+        if use_cache:
+            query_embedding = self.sim_model.sentence_model.encode(query)
+            cached = self.answer_cache.get(cache_scope, query_embedding)
+            if cached is not None:
+                return cached
 
         reference_results = []
+        passage_score = float("-inf")
+        sim_contents = self.sim_model.most_similar(query, topn=topn)
         for query_id, id_score_dict in sim_contents.items():
             for corpus_id, s in id_score_dict.items():
                 reference_results.append(self.sim_model.corpus[corpus_id])
+                passage_score = max(passage_score, float(s))
+        if use_summary_index and self.has_summary_index():
+            level, summary_results, summary_score = self.summary_index.search(query, query_embedding)
+            if summary_results and summary_score > passage_score:
+                # 摘要比原文更匹配(或是概括性问题), 只用摘要回答
+                logger.debug(f"summary index route: {query} ==> {level} {summary_score:.4f} > {passage_score:.4f}")
+                reference_results = summary_results
+            else:
+                reference_results = reference_results + summary_results
         if not reference_results:
             return '没有提供足够的相关信息', reference_results
         reference_results = self._add_source_numbers(reference_results)
@@ -121,11 +187,19 @@ class ChatPDF:
         context_str = '\n'.join(reference_results)[:(max_input_size - len(PROMPT_TEMPLATE))]
 
         if use_history:
-            response, out_history = llm_model.generate_answer(query, context_str, self.history, max_length=max_length)
+            response, out_history = llm_model.generate_answer(
+                query, context_str, self.history, max_length=max_length, prompt_template=PROMPT_TEMPLATE,
+                lora_model_name_or_path=lora_model_name_or_path
+            )
             self.history = out_history
         else:
-            response, out_history = llm_model.generate_answer(query, context_str)
+            response, out_history = llm_model.generate_answer(
+                query, context_str, prompt_template=PROMPT_TEMPLATE,
+                lora_model_name_or_path=lora_model_name_or_path
+            )
 
+        if use_cache:
+            self.answer_cache.put(cache_scope, query, query_embedding, (response, out_history, reference_results))
         return response, out_history, reference_results
 
     def save_index(self, index_path=None):
@@ -133,12 +207,26 @@ class ChatPDF:
         if index_path is None:
             index_path = '.'.join(self.pdf_path.split('.')[:-1]) + '_index.json'
         self.sim_model.save_index(index_path)
+        if self.summary_index is not None:
+            from utils.summary_index import get_summary_index_path
+            self.summary_index.save(get_summary_index_path(index_path))
+        self.index_path = index_path
 
     def load_index(self, index_path=None):
         """Load model."""
         if index_path is None:
             index_path = '.'.join(self.pdf_path.split('.')[:-1]) + '_index.json'
+        # 替换而不是合并已加载的语料
+        self.sim_model.corpus = {}
         self.sim_model.load_index(index_path)
+        self.load_summary_index(index_path)
+        self.index_path = index_path
+
+    def load_summary_index(self, index_path):
+        from utils.summary_index import SummaryIndex, get_summary_index_path
+
+        summary_index = SummaryIndex(self.sim_model.sentence_model, threshold=self.summary_threshold)
+        self.summary_index = summary_index if summary_index.load(get_summary_index_path(index_path)) else None
 
 
 if __name__ == "__main__":
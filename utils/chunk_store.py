@@ -0,0 +1,78 @@
+import threading
+import uuid
+from collections import OrderedDict
+from typing import List, Tuple
+
+from loguru import logger
+
+
+class ChunkStore(object):
+    """
+    Server side storage of summary input per UI session: the source text, the text it was split from
+    and the chunk list ({"offset": ..., "length": ..., "pre": ..., "post": ...}). Chunks only keep
+    their offsets into that text plus the coincide text of the neighbouring chunks, the chunk content
+    is read back from the text, so only a page of chunks is ever sent to the browser.
+    The least recently used sessions are dropped beyond `max_sessions`.
+    """
+
+    def __init__(self, max_sessions: int = 64):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_session(self, session_id: str) -> dict:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {"name": None, "source": "", "text": "", "chunks": []}
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                evict_id, _ = self._sessions.popitem(last=False)
+                logger.debug(f"chunk store drop session: {evict_id}")
+        self._sessions.move_to_end(session_id)
+        return session
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    def set_source(self, session_id: str, text: str, name: str = None):
+        with self._lock:
+            session = self._get_session(session_id)
+            session["name"] = name
+            session["source"] = text
+            session["text"] = ""
+            session["chunks"] = []
+
+    def get_source(self, session_id: str) -> str:
+        with self._lock:
+            return self._get_session(session_id)["source"]
+
+    def set_chunks(self, session_id: str, chunks: List[dict], text: str):
+        """Store the chunks together with the text their offsets point into."""
+        with self._lock:
+            session = self._get_session(session_id)
+            session["text"] = text
+            session["chunks"] = chunks
+
+    def get_chunk_texts(self, session_id: str, chunks: List[dict] = None) -> List[str]:
+        """Content of the given chunks (all chunks by default) with their coincide text."""
+        with self._lock:
+            session = self._get_session(session_id)
+            text = session["text"]
+            if chunks is None:
+                chunks = session["chunks"]
+            return [
+                f"{chunk['pre']}{text[chunk['offset']:chunk['offset'] + chunk['length']]}{chunk['post']}"
+                for chunk in chunks
+            ]
+
+    def get_chunks(self, session_id: str) -> List[dict]:
+        with self._lock:
+            return list(self._get_session(session_id)["chunks"])
+
+    def get_page(self, session_id: str, page: int = 1, page_size: int = 10) -> Tuple[List[dict], int, int]:
+        """Chunks of one page (1-based, clamped), the page and the page count."""
+        chunks = self.get_chunks(session_id)
+        total_pages = max((len(chunks) + page_size - 1) // page_size, 1)
+        page = min(max(int(page), 1), total_pages)
+        return chunks[(page - 1) * page_size: page * page_size], page, total_pages
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from loguru import logger
+
+CONTENT_FILE_EXTENSIONS = (".txt", ".pdf", ".docx", ".md")
+MANIFEST_FILE_NAME = ".manifest.json"
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def get_hasher(hash_algorithm: str = "md5"):
+    """md5 与历史索引文件名兼容; blake3/xxhash 更快, 未安装时回退到 md5"""
+    if hash_algorithm == "blake3":
+        try:
+            from blake3 import blake3
+            return blake3()
+        except ImportError:
+            logger.warning("blake3 not installed, fallback to md5")
+    elif hash_algorithm == "xxhash":
+        try:
+            import xxhash
+            return xxhash.xxh3_128()
+        except ImportError:
+            logger.warning("xxhash not installed, fallback to md5")
+    return hashlib.md5()
+
+
+def get_file_hash(fpath: str, hash_algorithm: str = "md5") -> str:
+    """Hash a file in fixed size chunks without reading it into memory."""
+    hasher = get_hasher(hash_algorithm)
+    with open(fpath, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ContentStore(object):
+    """
+    Files under CONTENT_DIR plus a persistent manifest of file -> hash/size/mtime,
+    so unchanged files are never rehashed and identical uploads are stored once.
+    """
+
+    def __init__(self, content_dir: str, hash_algorithm: str = "md5"):
+        self.content_dir = content_dir
+        self.hash_algorithm = hash_algorithm
+        self.manifest_path = os.path.join(content_dir, MANIFEST_FILE_NAME)
+        self._lock = threading.Lock()
+        self._manifest = self._load_manifest()
+        self._file_list = None
+        self._dir_mtime = None
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (IOError, json.JSONDecodeError):
+            logger.error(f"Could not load content manifest: {self.manifest_path}")
+            return {}
+        if manifest.get("hash_algorithm") != self.hash_algorithm:
+            return {}
+        return manifest.get("files", {})
+
+    def _save_manifest(self):
+        os.makedirs(self.content_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"hash_algorithm": self.hash_algorithm, "files": self._manifest}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def get_file_list(self):
+        """File names in CONTENT_DIR, the directory is only listed again when its mtime changes."""
+        if not os.path.exists(self.content_dir):
+            return []
+        dir_mtime = os.stat(self.content_dir).st_mtime_ns
+        if self._file_list is None or dir_mtime != self._dir_mtime:
+            self._file_list = [f for f in os.listdir(self.content_dir) if f.endswith(CONTENT_FILE_EXTENSIONS)]
+            self._dir_mtime = dir_mtime
+        return list(self._file_list)
+
+    def get_file_hash(self, filename: str) -> str:
+        """Hash of a file in CONTENT_DIR, reusing the manifest entry while size and mtime are unchanged."""
+        fpath = os.path.join(self.content_dir, filename)
+        stat = os.stat(fpath)
+        entry = self._manifest.get(filename)
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            return entry["hash"]
+
+        file_hash = get_file_hash(fpath, self.hash_algorithm)
+        logger.debug(f"hash {filename}: {stat.st_size} bytes ==> {file_hash}")
+        with self._lock:
+            self._manifest[filename] = {"hash": file_hash, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+            self._save_manifest()
+        return file_hash
+
+    def find_by_hash(self, file_hash: str, size: int):
+        for filename, entry in self._manifest.items():
+            if entry["hash"] == file_hash and entry["size"] == size \
+                    and os.path.exists(os.path.join(self.content_dir, filename)):
+                return filename
+        return None
+
+    def add_file(self, src_path: str) -> str:
+        """Move an uploaded file into CONTENT_DIR, returns the stored file name (an existing one if duplicated)."""
+        os.makedirs(self.content_dir, exist_ok=True)
+        size = os.path.getsize(src_path)
+        # 只有存在相同大小的文件时才计算 hash 去重, 否则 hash 推迟到首次加载文件时
+        file_hash = None
+        if any(entry["size"] == size for entry in self._manifest.values()):
+            file_hash = get_file_hash(src_path, self.hash_algorithm)
+
+        with self._lock:
+            existing = self.find_by_hash(file_hash, size) if file_hash is not None else None
+            if existing is not None:
+                logger.info(f"duplicate upload {os.path.basename(src_path)} ==> {existing}")
+                os.remove(src_path)
+                return existing
+
+            filename = os.path.basename(src_path)
+            dst_path = os.path.join(self.content_dir, filename)
+            shutil.move(src_path, dst_path)
+            self._manifest.pop(filename, None)
+            if file_hash is not None:
+                stat = os.stat(dst_path)
+                self._manifest[filename] = {"hash": file_hash, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+            self._save_manifest()
+        return filename
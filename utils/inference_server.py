@@ -0,0 +1,242 @@
+"""
+Local inference server: one process owns the LLM and embedding models and serves them
+over localhost HTTP, so several Gradio processes and batch jobs share one warm model.
+
+    python -m utils.inference_server --port 7870 --llm-model chatglm-6b-int4 --embedding-model text2vec-base
+
+Set `[server] url = "http://127.0.0.1:7870"` in settings.toml and `models.models` becomes a thin client.
+"""
+import argparse
+import http.client
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from loguru import logger
+
+# 允许远程调用的方法
+RPC_METHODS = {
+    "models": {"is_active", "is_loading", "status", "init_model", "init_model_background", "reset_model"},
+    "llm": {"generate_answer", "chat"},
+    "chatpdf": {
+        "has_index", "has_summary_index", "load_pdf_file", "load_index", "save_index", "query", "build_summary_index"
+    },
+}
+
+# 推理服务未启动或响应超时(socket timeout 即 TimeoutError)
+SERVER_UNAVAILABLE_ERRORS = (ConnectionError, TimeoutError)
+
+
+class InferenceClient(object):
+    """JSON RPC client, keeps one keep-alive connection per thread."""
+
+    def __init__(self, url: str, timeout: float = 600):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 7870
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _get_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def call(self, target: str, method: str, *args, **kwargs):
+        body = json.dumps({"target": target, "method": method, "args": args, "kwargs": kwargs}, ensure_ascii=False)
+        headers = {"Content-Type": "application/json"}
+        for retry in range(2):
+            conn = self._get_connection()
+            try:
+                conn.request("POST", "/rpc", body=body.encode("utf-8"), headers=headers)
+                response = json.loads(conn.getresponse().read().decode("utf-8"))
+                break
+            except (ConnectionError, http.client.HTTPException):
+                # 服务端关闭了空闲连接, 重连一次
+                conn.close()
+                self._local.conn = None
+                if retry:
+                    raise
+        if "error" in response:
+            raise RuntimeError(f"inference server {target}.{method}: {response['error']}")
+        return response["result"]
+
+
+class LLMClient(object):
+    def __init__(self, client: InferenceClient):
+        self.client = client
+
+    def generate_answer(self, query_str, context_str, history=None, max_length=1024, prompt_template=None,
+                        lora_model_name_or_path=None):
+        return tuple(self.client.call(
+            "llm", "generate_answer", query_str, context_str,
+            history=history, max_length=max_length, prompt_template=prompt_template,
+            lora_model_name_or_path=lora_model_name_or_path
+        ))
+
+    def chat(self, query_str, history=None, max_length=1024, lora_model_name_or_path=None):
+        return tuple(self.client.call(
+            "llm", "chat", query_str,
+            history=history, max_length=max_length, lora_model_name_or_path=lora_model_name_or_path
+        ))
+
+
+class ChatPDFClient(object):
+    def __init__(self, client: InferenceClient):
+        self.client = client
+
+    def has_index(self):
+        return self.client.call("chatpdf", "has_index")
+
+    def has_summary_index(self):
+        return self.client.call("chatpdf", "has_summary_index")
+
+    def build_summary_index(self, llm_model, chunk_length: int = 1024, section_fanout: int = 8,
+                            lora_model_name_or_path: str = None):
+        return self.client.call(
+            "chatpdf", "build_summary_index",
+            chunk_length=chunk_length, section_fanout=section_fanout,
+            lora_model_name_or_path=lora_model_name_or_path
+        )
+
+    def load_pdf_file(self, pdf_path: str):
+        return self.client.call("chatpdf", "load_pdf_file", pdf_path)
+
+    def load_index(self, index_path=None):
+        return self.client.call("chatpdf", "load_index", index_path)
+
+    def save_index(self, index_path=None):
+        return self.client.call("chatpdf", "save_index", index_path)
+
+    def query(self, llm_model, query, topn: int = 5, max_length: int = 1024, max_input_size: int = 1024,
+              use_history: bool = False, use_cache: bool = True, lora_model_name_or_path: str = None,
+              use_summary_index: bool = True, index_path: str = None):
+        # llm_model 使用服务端的模型
+        return tuple(self.client.call(
+            "chatpdf", "query", query,
+            topn=topn, max_length=max_length, max_input_size=max_input_size, use_history=use_history,
+            use_cache=use_cache, lora_model_name_or_path=lora_model_name_or_path,
+            use_summary_index=use_summary_index, index_path=index_path
+        ))
+
+
+class RemoteModels(object):
+    """Same interface as models.Models, backed by the inference server."""
+
+    def __init__(self, url: str):
+        self.client = InferenceClient(url)
+        self._chatpdf = ChatPDFClient(self.client)
+        self._llm_model = LLMClient(self.client)
+
+    def is_active(self):
+        try:
+            return self.client.call("models", "is_active")
+        except SERVER_UNAVAILABLE_ERRORS:
+            return False
+
+    def is_loading(self):
+        try:
+            return self.client.call("models", "is_loading")
+        except SERVER_UNAVAILABLE_ERRORS:
+            return False
+
+    @property
+    def status(self):
+        # 推理服务还未启动时 UI 照常启动, 由 load model 页的轮询更新状态
+        try:
+            return self.client.call("models", "status")
+        except SERVER_UNAVAILABLE_ERRORS:
+            return f"推理服务未连接: {self.client.host}:{self.client.port}"
+
+    @property
+    def chatpdf(self):
+        return self._chatpdf
+
+    @property
+    def llm_model(self):
+        return self._llm_model
+
+    def reset_model(self):
+        return self.client.call("models", "reset_model")
+
+    def init_model(self, llm_model, llm_lora, embedding_model):
+        return self.client.call("models", "init_model", llm_model, llm_lora, embedding_model)
+
+    def init_model_background(self, llm_model, llm_lora, embedding_model):
+        try:
+            return self.client.call("models", "init_model_background", llm_model, llm_lora, embedding_model)
+        except SERVER_UNAVAILABLE_ERRORS as e:
+            logger.warning(f"inference server unavailable, skip warmup: {e}")
+            return self.status
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers 和 body 分两次写入, 关闭 Nagle 避免 keep-alive 连接上等待 delayed ACK
+    disable_nagle_algorithm = True
+    models = None
+    # 单卡上的生成请求串行执行; 所有 UI 进程共用一个 ChatPDF, 修改它的调用也在锁内执行
+    generate_lock = threading.Lock()
+
+    def _dispatch(self, target, method, args, kwargs):
+        if method not in RPC_METHODS.get(target, ()):
+            raise ValueError(f"unknown method {target}.{method}")
+        if target == "models":
+            if method == "status":
+                return self.models.status
+            return getattr(self.models, method)(*args, **kwargs)
+        if not self.models.is_active():
+            raise RuntimeError("模型还未加载")
+        if target == "llm":
+            with self.generate_lock:
+                return getattr(self.models.llm_model, method)(*args, **kwargs)
+        with self.generate_lock:
+            if method in ("query", "build_summary_index"):
+                return getattr(self.models.chatpdf, method)(self.models.llm_model, *args, **kwargs)
+            return getattr(self.models.chatpdf, method)(*args, **kwargs)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length).decode("utf-8"))
+        try:
+            result = self._dispatch(
+                request["target"], request["method"], request.get("args", []), request.get("kwargs", {})
+            )
+            response = {"result": result}
+        except Exception as e:
+            logger.error(f"{request.get('target')}.{request.get('method')} failed: {e}")
+            response = {"error": str(e)}
+        body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def serve(host: str = "127.0.0.1", port: int = 7870, llm_model=None, llm_lora="", embedding_model=None):
+    from models import Models
+
+    InferenceRequestHandler.models = Models.instance()
+    if llm_model and embedding_model:
+        InferenceRequestHandler.models.init_model_background(llm_model, llm_lora, embedding_model)
+    server = ThreadingHTTPServer((host, port), InferenceRequestHandler)
+    logger.info(f"inference server listen on http://{host}:{port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7870)
+    parser.add_argument("--llm-model", type=str, default=None)
+    parser.add_argument("--llm-lora", type=str, default="")
+    parser.add_argument("--embedding-model", type=str, default=None)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.llm_model, args.llm_lora, args.embedding_model)
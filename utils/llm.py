@@ -1,4 +1,8 @@
-from textgen import ChatGlmModel, LlamaModel
+import os
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+
 from loguru import logger
 
 
@@ -8,43 +12,112 @@ class LLM(object):
             gen_model_type: str = "chatglm",
             gen_model_name_or_path: str = "THUDM/chatglm-6b-int4",
             lora_model_name_or_path: str = None,
+            max_loaded_loras: int = 4,
 
     ):
+        from textgen import ChatGlmModel, LlamaModel
 
         self.model_type = gen_model_type
 
+        # lora 由 LLM 自己挂载, 基础模型常驻, 切换 lora 不需要重新加载
         if gen_model_type == "chatglm":
             self.gen_model = ChatGlmModel(
                 gen_model_type,
                 gen_model_name_or_path,
-                lora_name=lora_model_name_or_path,
             )
         elif gen_model_type == "llama":
 
             self.gen_model = LlamaModel(
                 gen_model_type,
                 gen_model_name_or_path,
-                lora_name=lora_model_name_or_path,
             )
 
         else:
             raise ValueError('gen_model_type must be chatglm or llama.')
         self.history = None
 
-    def generate_answer(self, query_str, context_str, history=None, max_length=1024, prompt_template=None):
+        self.max_loaded_loras = max_loaded_loras
+        # lora path -> peft adapter name, 按最近使用排序
+        self._loras = OrderedDict()
+        self._lora_count = 0
+        self.default_lora = None
+        self._lock = threading.Lock()
+        self.set_default_lora(lora_model_name_or_path)
+
+    def set_default_lora(self, lora_model_name_or_path: str = None):
+        """Lora used when a request does not select one, None for the base model."""
+        if lora_model_name_or_path:
+            with self._lock:
+                self._load_lora(lora_model_name_or_path)
+        self.default_lora = lora_model_name_or_path or None
+
+    def _load_lora(self, lora_model_name_or_path: str) -> str:
+        if lora_model_name_or_path in self._loras:
+            self._loras.move_to_end(lora_model_name_or_path)
+            return self._loras[lora_model_name_or_path]
+
+        from peft import PeftModel
+
+        # peft adapter name 不能包含 "."
+        adapter_name = f"lora_{self._lora_count}"
+        self._lora_count += 1
+        if isinstance(self.gen_model.model, PeftModel):
+            self.gen_model.model.load_adapter(lora_model_name_or_path, adapter_name=adapter_name)
+        else:
+            self.gen_model.model = PeftModel.from_pretrained(
+                self.gen_model.model, lora_model_name_or_path, adapter_name=adapter_name
+            )
+        self.gen_model.lora_loaded = True
+        self._loras[lora_model_name_or_path] = adapter_name
+        logger.info(f"load lora: {lora_model_name_or_path} ==> {adapter_name}")
+
+        while len(self._loras) > self.max_loaded_loras:
+            evict = [(path, name) for path, name in self._loras.items()
+                     if path not in (self.default_lora, lora_model_name_or_path)]
+            if not evict:
+                break
+            evict_path, evict_name = evict[0]
+            del self._loras[evict_path]
+            self.gen_model.model.delete_adapter(evict_name)
+            logger.info(f"unload lora: {evict_path}")
+        return adapter_name
+
+    def resolve_lora(self, lora_model_name_or_path: str = None):
+        """The lora a request actually runs with: the default one when empty or not an existing path."""
+        if not lora_model_name_or_path:
+            return self.default_lora
+        if not os.path.exists(lora_model_name_or_path):
+            logger.warning(f"lora path not exists: {lora_model_name_or_path}, use default lora: {self.default_lora}")
+            return self.default_lora
+        return lora_model_name_or_path
+
+    def _use_lora(self, lora_model_name_or_path: str = None):
+        """Activate the selected lora, returns the context the generation runs in."""
+        lora_model_name_or_path = self.resolve_lora(lora_model_name_or_path)
+        if lora_model_name_or_path is None:
+            if self._loras:
+                return self.gen_model.model.disable_adapter()
+            return nullcontext()
+        self.gen_model.model.set_adapter(self._load_lora(lora_model_name_or_path))
+        return nullcontext()
+
+    def generate_answer(self, query_str, context_str, history=None, max_length=1024, prompt_template=None,
+                        lora_model_name_or_path=None):
         """Generate answer from query and context."""
         if self.model_type == "t5":
             response = self.gen_model(query_str, max_length=max_length, do_sample=True)[0]['generated_text']
             return response, history
         prompt = prompt_template.format(context_str=context_str, query_str=query_str)
-        response, out_history = self.gen_model.chat(prompt, history, max_length=max_length)
+        with self._lock, self._use_lora(lora_model_name_or_path):
+            response, out_history = self.gen_model.chat(prompt, history, max_length=max_length)
         return response, out_history
 
-    def chat(self, query_str, history=None, max_length=1024):
+    def chat(self, query_str, history=None, max_length=1024, lora_model_name_or_path=None):
         if self.model_type == "t5":
             response = self.gen_model(query_str, max_length=max_length, do_sample=True)[0]['generated_text']
             logger.debug(response)
             return response, history
 
-        response, out_history = self.gen_model.chat(query_str, history, max_length=max_length)
+        with self._lock, self._use_lora(lora_model_name_or_path):
+            response, out_history = self.gen_model.chat(query_str, history, max_length=max_length)
         return response, out_history
@@ -0,0 +1,183 @@
+import os
+import time
+from typing import List, Union
+
+import numpy as np
+from loguru import logger
+from tqdm import trange
+
+pwd_path = os.path.abspath(os.path.dirname(__file__))
+
+ONNX_CACHE_DIR = os.path.join(os.path.dirname(pwd_path), "onnx_models")
+
+
+class OnnxSentenceModel(object):
+    """
+    CPU sentence embedding backend: the HuggingFace encoder is exported to ONNX once,
+    dynamically quantized to int8 and run with onnxruntime.
+    Exposes the `encode` signature of text2vec's SentenceModel so it can be passed
+    straight to `similarities.Similarity(model_name_or_path=...)`.
+    """
+
+    def __init__(
+            self,
+            model_name_or_path: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+            max_seq_length: int = 128,
+            cache_dir: str = ONNX_CACHE_DIR,
+            num_threads: int = 0,
+            quantize: bool = True,
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name_or_path = model_name_or_path
+        self.max_seq_length = max_seq_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+
+        model_dir = os.path.join(cache_dir, model_name_or_path.replace("/", "--").replace("\\", "--"))
+        fp32_path = os.path.join(model_dir, "model.onnx")
+        int8_path = os.path.join(model_dir, "model.int8.onnx")
+        if not os.path.exists(fp32_path):
+            self.export_onnx(model_name_or_path, fp32_path)
+        if quantize and not os.path.exists(int8_path):
+            self.quantize_onnx(fp32_path, int8_path)
+        self.onnx_path = int8_path if quantize else fp32_path
+
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if num_threads > 0:
+            sess_options.intra_op_num_threads = num_threads
+            sess_options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            self.onnx_path,
+            sess_options=sess_options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        logger.info(f"load onnx embedding model: {self.onnx_path} threads: {num_threads}")
+
+    def __str__(self):
+        return f"<OnnxSentenceModel: {self.model_name_or_path}, onnx: {self.onnx_path}, " \
+               f"max_seq_length: {self.max_seq_length}>"
+
+    @staticmethod
+    def export_onnx(model_name_or_path: str, onnx_path: str):
+        """Export the encoder's last_hidden_state to ONNX with dynamic batch/sequence axes."""
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+        model = AutoModel.from_pretrained(model_name_or_path)
+        model.eval()
+
+        features = tokenizer(["导出 onnx 模型"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in features]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(features[name] for name in input_names),
+                onnx_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+                do_constant_folding=True,
+            )
+        logger.info(f"export onnx model: {model_name_or_path} ==> {onnx_path}")
+
+    @staticmethod
+    def quantize_onnx(fp32_path: str, int8_path: str):
+        """Dynamic int8 weight quantization of the exported model."""
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        logger.info(f"quantize onnx model: {fp32_path} ==> {int8_path}")
+
+    def get_sentence_embedding_dimension(self):
+        return self.session.get_outputs()[0].shape[-1]
+
+    def encode(
+            self,
+            sentences: Union[str, List[str]],
+            batch_size: int = 32,
+            show_progress_bar: bool = False,
+            convert_to_numpy: bool = True,
+            convert_to_tensor: bool = False,
+            device: str = None,
+            normalize_embeddings: bool = False,
+            max_seq_length: int = None,
+    ):
+        """Returns the mean pooling embeddings for a batch of sentences."""
+        if max_seq_length is None:
+            max_seq_length = self.max_seq_length
+        input_is_string = False
+        if isinstance(sentences, str) or not hasattr(sentences, "__len__"):
+            sentences = [sentences]
+            input_is_string = True
+
+        all_embeddings = []
+        # 按长度排序，减少 padding
+        length_sorted_idx = np.argsort([-len(s) for s in sentences])
+        sentences_sorted = [sentences[idx] for idx in length_sorted_idx]
+        for start_index in trange(0, len(sentences), batch_size, desc="Batches", disable=not show_progress_bar):
+            sentences_batch = sentences_sorted[start_index: start_index + batch_size]
+            features = self.tokenizer(
+                sentences_batch, max_length=max_seq_length,
+                padding=True, truncation=True, return_tensors="np"
+            )
+            inputs = {k: v.astype(np.int64) for k, v in features.items() if k in self.input_names}
+            token_embeddings = self.session.run(None, inputs)[0]
+            input_mask_expanded = np.expand_dims(features["attention_mask"], -1).astype(np.float32)
+            embeddings = np.sum(token_embeddings * input_mask_expanded, 1) / np.clip(
+                input_mask_expanded.sum(1), a_min=1e-9, a_max=None)
+            if normalize_embeddings:
+                embeddings = embeddings / np.clip(
+                    np.linalg.norm(embeddings, axis=1, keepdims=True), a_min=1e-12, a_max=None)
+            all_embeddings.extend(embeddings)
+        all_embeddings = np.asarray([all_embeddings[idx] for idx in np.argsort(length_sorted_idx)])
+
+        if convert_to_tensor:
+            import torch
+            all_embeddings = torch.from_numpy(all_embeddings)
+
+        if input_is_string:
+            all_embeddings = all_embeddings[0]
+
+        return all_embeddings
+
+
+if __name__ == "__main__":
+    # 对比 PyTorch fp32 与 ONNX int8 的速度和精度:
+    # python -m utils.onnx_embedding <model_name_or_path> <txt file>
+    import sys
+    from text2vec import SentenceModel
+
+    model_name_or_path = sys.argv[1] if len(sys.argv) > 1 else "shibing624/text2vec-base-chinese"
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "r", encoding="utf-8") as f:
+            corpus = [line.strip() for line in f.readlines() if line.strip()]
+    else:
+        corpus = [f"第{i}段: 自然语言中的非平行迁移是指在没有成对语料的情况下进行风格迁移。" * (1 + i % 4)
+                  for i in range(512)]
+
+    torch_model = SentenceModel(model_name_or_path, max_seq_length=128, device="cpu")
+    onnx_model = OnnxSentenceModel(model_name_or_path, max_seq_length=128)
+
+    start = time.perf_counter()
+    torch_emb = torch_model.encode(corpus, batch_size=32)
+    torch_cost = time.perf_counter() - start
+
+    start = time.perf_counter()
+    onnx_emb = onnx_model.encode(corpus, batch_size=32)
+    onnx_cost = time.perf_counter() - start
+
+    cos = np.sum(torch_emb * onnx_emb, axis=1) / (
+            np.linalg.norm(torch_emb, axis=1) * np.linalg.norm(onnx_emb, axis=1))
+    print(f"sentences: {len(corpus)}")
+    print(f"pytorch fp32: {torch_cost:.2f}s {len(corpus) / torch_cost:.1f} sent/s")
+    print(f"onnx int8:    {onnx_cost:.2f}s {len(corpus) / onnx_cost:.1f} sent/s speedup: {torch_cost / onnx_cost:.2f}x")
+    print(f"cosine(pytorch, onnx) mean: {cos.mean():.4f} min: {cos.min():.4f}")
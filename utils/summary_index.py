@@ -0,0 +1,165 @@
+import json
+import os
+from typing import List
+
+import numpy as np
+from loguru import logger
+
+SUMMARY_PROMPT_TEMPLATE = """\
+使用中文{query_str}:
+{context_str}
+"""
+
+SUMMARY_LEVELS = ("document", "section", "chunk")
+
+# 概括性的问题直接使用文档摘要
+OVERVIEW_KEYWORDS = ("主要讲", "讲了什么", "讲什么", "主要内容", "概括", "总结", "概述", "摘要", "大意")
+
+
+def get_summary_index_path(index_path: str) -> str:
+    return '.'.join(index_path.split('.')[:-1]) + '.summary.json'
+
+
+class SummaryIndex(object):
+    """
+    Summary tree of one document: chunk summaries are rolled up into section summaries and
+    one document summary. Each level is searchable, so broad questions are answered from a
+    few short summary nodes instead of many raw passages.
+    """
+
+    def __init__(self, sentence_model, threshold: float = 0.75, topn: int = 3):
+        self.sentence_model = sentence_model
+        self.threshold = threshold
+        self.topn = topn
+        # level -> [{"text": ..., "children": [...]}]
+        self.nodes = {level: [] for level in SUMMARY_LEVELS}
+        self.embeddings = {level: np.zeros((0, 0), dtype=np.float32) for level in SUMMARY_LEVELS}
+
+    def __len__(self):
+        return sum(len(nodes) for nodes in self.nodes.values())
+
+    @staticmethod
+    def _group_by_length(texts: List[str], max_length: int) -> List[List[int]]:
+        groups, group, length = [], [], 0
+        for idx, text in enumerate(texts):
+            if group and length + len(text) > max_length:
+                groups.append(group)
+                group, length = [], 0
+            group.append(idx)
+            length += len(text)
+        if group:
+            groups.append(group)
+        return groups
+
+    @staticmethod
+    def _summarize(llm_model, texts: List[str], summary_prompt: str, max_length: int,
+                   lora_model_name_or_path: str = None) -> str:
+        return llm_model.generate_answer(
+            summary_prompt,
+            "\n".join(texts),
+            history=None,
+            max_length=max_length,
+            prompt_template=SUMMARY_PROMPT_TEMPLATE,
+            lora_model_name_or_path=lora_model_name_or_path
+        )[0]
+
+    def build(
+            self,
+            corpus: List[str],
+            llm_model,
+            summary_prompt: str = "生成以下内容的摘要",
+            chunk_length: int = 1024,
+            section_fanout: int = 8,
+            max_length: int = 2048,
+            lora_model_name_or_path: str = None,
+    ):
+        """Summarize corpus chunks, then sections of `section_fanout` chunks, then the whole document."""
+        chunk_groups = self._group_by_length(corpus, chunk_length)
+        chunks = []
+        for group in chunk_groups:
+            text = self._summarize(
+                llm_model, [corpus[i] for i in group], summary_prompt, max_length, lora_model_name_or_path
+            )
+            chunks.append({"text": text, "children": group})
+        logger.debug(f"summary index chunks: {len(corpus)} ==> {len(chunks)}")
+
+        sections = []
+        for start in range(0, len(chunks), section_fanout):
+            group = list(range(start, min(start + section_fanout, len(chunks))))
+            if len(chunks) <= section_fanout:
+                text = "\n".join(chunks[i]["text"] for i in group)
+            else:
+                text = self._summarize(
+                    llm_model, [chunks[i]["text"] for i in group], summary_prompt, max_length, lora_model_name_or_path
+                )
+            sections.append({"text": text, "children": group})
+        logger.debug(f"summary index sections: {len(chunks)} ==> {len(sections)}")
+
+        document = self._summarize(
+            llm_model, [s["text"] for s in sections], summary_prompt, max_length, lora_model_name_or_path
+        )
+        self.nodes = {
+            "document": [{"text": document, "children": list(range(len(sections)))}],
+            "section": sections,
+            "chunk": chunks,
+        }
+        self._encode()
+        return self
+
+    def _encode(self):
+        for level in SUMMARY_LEVELS:
+            texts = [node["text"] for node in self.nodes[level]]
+            if not texts:
+                continue
+            embeddings = np.asarray(self.sentence_model.encode(texts), dtype=np.float32)
+            self.embeddings[level] = embeddings / np.clip(
+                np.linalg.norm(embeddings, axis=1, keepdims=True), a_min=1e-12, a_max=None)
+
+    def search(self, query: str, query_embedding=None):
+        """
+        Find the cheapest matching level: document, section, then chunk summaries.
+        Returns (level, texts, score), or (None, [], -inf) when no level reaches the threshold.
+        Overview questions match the document level with an infinite score; otherwise the caller
+        compares the score with the best passage score to decide between summaries and passages.
+        """
+        if not len(self):
+            return None, [], float("-inf")
+        if any(keyword in query for keyword in OVERVIEW_KEYWORDS):
+            return "document", [node["text"] for node in self.nodes["document"]], float("inf")
+
+        if query_embedding is None:
+            query_embedding = self.sentence_model.encode(query)
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        query_embedding = query_embedding / max(float(np.linalg.norm(query_embedding)), 1e-12)
+        for level in SUMMARY_LEVELS:
+            if not self.nodes[level]:
+                continue
+            scores = self.embeddings[level] @ query_embedding
+            top_ids = [int(i) for i in np.argsort(-scores)[:self.topn] if scores[i] >= self.threshold]
+            if top_ids:
+                return level, [self.nodes[level][i]["text"] for i in top_ids], float(scores[top_ids[0]])
+        return None, [], float("-inf")
+
+    def save(self, path: str):
+        data = {
+            level: [{**node, "emb": emb.tolist()} for node, emb in zip(self.nodes[level], self.embeddings[level])]
+            for level in SUMMARY_LEVELS
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        logger.debug(f"Save summary index to file: {path}.")
+
+    def load(self, path: str):
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (IOError, json.JSONDecodeError):
+            logger.error(f"Error: Could not load summary index from file: {path}")
+            return False
+        for level in SUMMARY_LEVELS:
+            nodes = data.get(level, [])
+            self.nodes[level] = [{"text": node["text"], "children": node["children"]} for node in nodes]
+            self.embeddings[level] = np.asarray([node["emb"] for node in nodes], dtype=np.float32)
+        return True